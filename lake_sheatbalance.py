@@ -1,14 +1,44 @@
 import numpy as np
+import pandas as pd
+from numba import float32, float64, njit, prange, vectorize
+
+# fastmath without "nnan"/"ninf": meteo records contain NaN gaps
+FASTMATH = {"nsz", "arcp", "contract", "afn", "reassoc"}
+
+# Magnus formula coefficients for saturated vapor pressure over water
+EW_A1 = 6.112  # [hPa]
+EW_A2 = 17.62
+EW_A3 = 243.12  # [degC]
+
+SIGMA = 5.67e-8  # Stefan-Boltzmann constant [Wm-2K-4]
+
+# Atmosphere emmisivity coefficients
+EMI_A1 = 0.98
+EMI_A2 = 0.17
+EMI_A3 = 1.24
+
+LW_REFLECTION = 0.03  # Reflection of IR from water surface
+LW_WATER_EMI = 0.972  # LW water emmissivity
+
+# Transfer function coefficients
+F1_A1 = 4.8  # [Wm-2hPa-1]
+F1_A2 = 1.98  # [Wm-2hPa-1(ms-1)-1]
+F1_A3 = 0.28  # [Wm-2hPa-1K-1]
+
+# Psychrometric constant
+CP_AIR = 1005  # Air heat capacity [J Kg'1 K-1] at 20degC
+LV = 2.47e6  # Latent heat of vaporization [JKg-1]
+MV = 0.622  # MV ratio
 
 
 ## FIX Assuming all inputs are pandas series!!
-def atm_emmissivity(temp, cc, ew):
+def atm_emmissivity(atemp_k, cc, ew):
     """Calculate atmospere emmisivity
 
     Parameters
     ----------
-    temp : array
-        Air temperature at 2 meter in degC
+    atemp_k : array
+        Air temperature at 2 meter in K
     cc: array
         Cloud cover [-]
     ew: array
@@ -19,11 +49,8 @@ def atm_emmissivity(temp, cc, ew):
     emi : array
         Atmosphere emmisivity
     """
-    A1 = 0.98
-    A2 = 0.17
-    A3 = 1.24
-    atemp_k = temp + 273.15
-    emi = A1 * (1 + A2 * cc**2) * A3 * (ew / atemp_k) ** (1 / 7)
+    # (ew / atemp_k)**(1/7) through exp/log, cheaper than a fractional pow
+    emi = EMI_A1 * (1 + EMI_A2 * cc**2) * EMI_A3 * np.exp(np.log(ew / atemp_k) / 7)
     return emi
 
 
@@ -43,19 +70,19 @@ def swrad_in(rad, albedo):
         Absorved solar radiation in Wm-2
     """
 
-    rad_out = 0*rad.copy()
-    rad_out.loc[rad > 5] = rad.loc[rad>5] * albedo.loc[rad>5]
-    hs = rad - rad_out
+    r = np.asarray(rad)
+    hs = np.where(r > 5, r * (1 - np.asarray(albedo)), r)
+    hs = pd.Series(hs, index=rad.index, name=rad.name)
     return hs
 
 
-def absorved_lw(temp, emi):
+def absorved_lw(atemp_k, emi):
     """Calculate absorved longwave radiation.
 
     Parameters
     ----------
-    temp : array
-        Air temperature at 2 meter in degC
+    atemp_k : array
+        Air temperature at 2 meter in K
     emi : array
         Atmosphere emmisivity
 
@@ -65,10 +92,8 @@ def absorved_lw(temp, emi):
         Absorved longwave radiation in Wm-2
     """
 
-    A1 = 0.03  # Reflection of IR from water surface
-    sigma = 5.67e-8  # [Wm-2K-4]
-    atemp_k = temp + 273.15
-    ha = (1 - A1) * emi * sigma * atemp_k**4
+    atemp_k2 = atemp_k * atemp_k
+    ha = (1 - LW_REFLECTION) * emi * SIGMA * atemp_k2 * atemp_k2
     return ha
 
 
@@ -85,10 +110,9 @@ def emmited_lw(wtemp):
     hw = array
         Longwave radiation emmited by the lake in Wm-2.
     """
-    A1 = 0.972  # LW water emmissivity
-    sigma = 5.67e-8  # [Wm-2K-4]
     wtemp_k = wtemp + 273.15
-    hw = -A1 * sigma * wtemp_k**4
+    wtemp_k2 = wtemp_k * wtemp_k
+    hw = -LW_WATER_EMI * SIGMA * wtemp_k2 * wtemp_k2
     return hw
 
 
@@ -105,10 +129,7 @@ def sat_vaporpress(temp):
     ew : array
         Saturated vapor pressure in hPa
     """
-    A1 = 6.112
-    A2 = 17.62
-    A3 = 243.12
-    ew = A1 * np.exp((A2 * temp) / (A3 + temp))
+    ew = EW_A1 * np.exp((EW_A2 * temp) / (EW_A3 + temp))
     return ew
 
 
@@ -130,10 +151,7 @@ def transfer_function(wind10, wtemp, temp):
         Transfer function (REF) in Wm-2hPa-1
     """
 
-    A1 = 4.8
-    A2 = 1.98
-    A3 = 0.28
-    f1 = A1 + A2 * wind10 + A3 * (wtemp - temp)
+    f1 = F1_A1 + F1_A2 * wind10 + F1_A3 * (wtemp - temp)
     return f1
 
 
@@ -159,7 +177,7 @@ def latent_heat(f1, ew, ea):
     return he
 
 
-def vapor_pressure(temp, rh):
+def vapor_pressure(temp, rh, es=None):
     """Calculate vapor pressure from relative humidity.
 
     Parameters
@@ -168,6 +186,9 @@ def vapor_pressure(temp, rh):
         Air temperature at 2m in degC
     rh : array
         Relative humidity at 2m in percent
+    es : array, optional
+        Saturated vapor pressure at temp in hPa, if already computed with
+        sat_vaporpress
 
     Return
     ------
@@ -175,8 +196,9 @@ def vapor_pressure(temp, rh):
         Vapor pressure in hPa
     """
 
-    es = sat_vaporpress(temp)
-    ew = rh * es/100
+    if es is None:
+        es = sat_vaporpress(temp)
+    ew = rh * es * 0.01
     return ew
 
 
@@ -193,10 +215,7 @@ def psychrometric_constant(airp):
     psy : array
         psychrometric constant in hPaK-1
     """
-    CP = 1005  # Air heat capacity [J Kg'1 K-1] at 20degC
-    LV = 2.47e6  # Latent heat of vaporization [JKg-1]
-    MV = 0.622  # MV ratio
-    psy = CP * airp / (LV * MV)
+    psy = CP_AIR * airp / (LV * MV)
     return psy
 
 
@@ -246,3 +265,143 @@ def heat_balance(hs, ha, hw, he, hc):
     """
     hnet = hs + ha + hw + he + hc
     return hnet
+
+
+@njit(fastmath=FASTMATH, cache=True)
+def compute_hnet_scalar(airt, clouds, ws10, wtemp, rh, airp, rad, albedo):
+    """Calculate net heat flux for a single timestep.
+
+    Fused version of the individual flux functions of this module, shared
+    by compute_hnet and compute_hnet_ufunc.
+
+    Parameters
+    ----------
+    airt : float
+        Air temperature at 2 meter in degC
+    clouds : float
+        Cloud cover [-]
+    ws10 : float
+        Wind velocity at 10 m in ms-1
+    wtemp : float
+        Surface water temperature in degC
+    rh : float
+        Relative humidity at 2m in percent
+    airp : float
+        Air pressure in hPa
+    rad : float
+        Incoming solar radiation in Wm2
+    albedo : float
+        Water albedo [-]
+
+    Returns
+    -------
+    hnet : float
+        Net heat flux in Wm-2.
+    """
+    atemp_k = airt + 273.15
+    wtemp_k = wtemp + 273.15
+    x = (EW_A2 * airt) / (EW_A3 + airt)
+    ew = EW_A1 * np.exp(x)
+    ea = rh * ew * 0.01
+    f1 = F1_A1 + F1_A2 * ws10 + F1_A3 * (wtemp - airt)
+    # (ew / atemp_k)**(1/7) with log(ew) = log(EW_A1) + x
+    emi = (
+        EMI_A1
+        * (1 + EMI_A2 * clouds**2)
+        * EMI_A3
+        * np.exp((x + np.log(EW_A1 / atemp_k)) / 7)
+    )
+    psy = CP_AIR * airp / (LV * MV)
+    if rad > 5:
+        hs = rad * (1 - albedo)
+    else:
+        hs = rad
+    atemp_k2 = atemp_k * atemp_k
+    wtemp_k2 = wtemp_k * wtemp_k
+    ha = (1 - LW_REFLECTION) * emi * SIGMA * atemp_k2 * atemp_k2
+    hw = -LW_WATER_EMI * SIGMA * wtemp_k2 * wtemp_k2
+    he = -f1 * (ew - ea)  # Same as latent_heat, keep both in sync
+    hc = -psy * f1 * (wtemp - airt)
+    hnet = hs + ha + hw + he + hc
+    return hnet
+
+
+@njit(parallel=True, fastmath=FASTMATH, cache=True)
+def compute_hnet(airt, clouds, ws10, wtemp, rh, airp, rad, albedo):
+    """Calculate net heat flux from meteorological data in a single pass.
+
+    compute_hnet_scalar compiled by numba into one parallel loop over time,
+    without temporary arrays. Inputs must be contiguous numpy arrays of the
+    same length and dtype (float32 or float64), which is also the dtype of
+    the result.
+
+    Parameters
+    ----------
+    airt : array
+        Air temperature at 2 meter in degC
+    clouds : array
+        Cloud cover [-]
+    ws10 : array
+        Wind velocity at 10 m in ms-1
+    wtemp : array
+        Surface water temperature in degC
+    rh : array
+        Relative humidity at 2m in percent
+    airp : array
+        Air pressure in hPa
+    rad : array
+        Incoming solar radiation in Wm2
+    albedo : array
+        Water albedo [-]
+
+    Returns
+    -------
+    hnet : array
+        Net heat flux in Wm-2.
+    """
+    n = airt.shape[0]
+    hnet = np.empty_like(airt)
+    for i in prange(n):
+        hnet[i] = compute_hnet_scalar(
+            airt[i], clouds[i], ws10[i], wtemp[i], rh[i], airp[i], rad[i], albedo[i]
+        )
+    return hnet
+
+
+@vectorize(
+    [float32(*(float32,) * 8), float64(*(float64,) * 8)],
+    fastmath=FASTMATH,
+    cache=True,
+)
+def compute_hnet_ufunc(airt, clouds, ws10, wtemp, rh, airp, rad, albedo):
+    """Calculate net heat flux as a numpy ufunc.
+
+    Single threaded alternative to compute_hnet for environments where
+    numba's parallel backend is not available. Inputs broadcast like any
+    numpy ufunc and need not be contiguous.
+
+    Parameters
+    ----------
+    airt : array
+        Air temperature at 2 meter in degC
+    clouds : array
+        Cloud cover [-]
+    ws10 : array
+        Wind velocity at 10 m in ms-1
+    wtemp : array
+        Surface water temperature in degC
+    rh : array
+        Relative humidity at 2m in percent
+    airp : array
+        Air pressure in hPa
+    rad : array
+        Incoming solar radiation in Wm2
+    albedo : array
+        Water albedo [-]
+
+    Returns
+    -------
+    hnet : array
+        Net heat flux in Wm-2.
+    """
+    return compute_hnet_scalar(airt, clouds, ws10, wtemp, rh, airp, rad, albedo)
@@ -1,28 +1,47 @@
-import matplotlib.pyplot as plt
+import argparse
+
 import numpy as np
 import pandas as pd
 import pylake
+from numba import njit, prange
 
 import lake_sheatbalance as lhb
 
-plt.style.use("~/.config/matplotlib/aslo-paper.mplstyle")
-
 BATHFILE = "~/Dropbox/Cesar/PostDoc/Projects/OMP-Daily/Data/Bretaye/Bathymetry/BRE_BATHYMETRY.csv"
 TEMPFILE = "~/Dropbox/Cesar/PostDoc/Projects/OMP-Daily/Data/Bretaye/Mooring/Mooring_LacBretaye_M1_10min.csv"
 DEPTHFILE = "~/Dropbox/Cesar/PostDoc/Projects/OMP-Daily/Data/Bretaye/Mooring/Depth_Mooring_LacBretaye_M1_10min.csv"
-
-
-def main():
+METEO_DTYPES = {
+    "Rad_Wm2": np.float32,
+    "AirTemp_degC": np.float32,
+    "AirPress_hPa": np.float32,
+    "RH_%": np.float32,
+    "WS10_ms": np.float32,
+    "WD10_degN": np.float32,
+    "Albedo": np.float32,
+    "Clouds_Tot": np.float32,
+}
+
+
+def main(plot=False, show=True, output=None):
     bath_data = pd.read_csv(
         BATHFILE, skiprows=5, usecols=[0, 2], names=["Depth_m", "Area_m2"]
     )
-    temp_data = pd.read_csv(TEMPFILE, parse_dates=[0], index_col=[0], na_values="NaN")
-    depth_data = pd.read_csv(DEPTHFILE, parse_dates=[0], index_col=[0])
+    temp_data = pd.read_csv(
+        TEMPFILE, engine="pyarrow", parse_dates=[0], index_col=[0], na_values=["NaN"]
+    )
+    depth_data = pd.read_csv(
+        DEPTHFILE, engine="pyarrow", parse_dates=[0], index_col=[0]
+    )
     temp_data = temp_data.resample("h").mean().interpolate(limit_direction="both")
     depth_data = depth_data.resample("h").mean().interpolate(limit_direction="both")
 
     meteo_data = pd.read_csv(
-        "Data.csv", parse_dates=[0], index_col=[0], dtype=float, na_values="NAN"
+        "Data.csv",
+        engine="pyarrow",
+        parse_dates=[0],
+        index_col=[0],
+        dtype=METEO_DTYPES,
+        na_values=["NAN"],
     )
     mindate = max([meteo_data.index.min(), temp_data.index.min()])
     maxdate = min([meteo_data.index.max(), temp_data.index.max()])
@@ -31,31 +50,26 @@ def main():
     temp_data = temp_data[mindate:maxdate]
     depth_data = depth_data[mindate:maxdate]
 
-    meteo_data["ew"] = lhb.sat_vaporpress(meteo_data["AirTemp_degC"])
-    meteo_data["emi"] = lhb.atm_emmissivity(
-        meteo_data["AirTemp_degC"], meteo_data["Clouds_Tot"], meteo_data.ew
+    # Fluxes only carry ~3 significant figures: float32 halves memory traffic
+    hnet = lhb.compute_hnet(
+        meteo_data["AirTemp_degC"].to_numpy(dtype=np.float32),
+        meteo_data["Clouds_Tot"].to_numpy(dtype=np.float32),
+        meteo_data["WS10_ms"].to_numpy(dtype=np.float32),
+        temp_data["0.45"].reindex(meteo_data.index).to_numpy(dtype=np.float32),
+        meteo_data["RH_%"].to_numpy(dtype=np.float32),
+        meteo_data["AirPress_hPa"].to_numpy(dtype=np.float32),
+        meteo_data["Rad_Wm2"].to_numpy(dtype=np.float32),
+        meteo_data["Albedo"].to_numpy(dtype=np.float32),
     )
-    meteo_data["f1"] = lhb.transfer_function(
-        meteo_data.WS10_ms, temp_data["0.45"], meteo_data["AirTemp_degC"]
-    )
-    meteo_data["ea"] = lhb.vapor_pressure(
-        meteo_data["AirTemp_degC"], meteo_data["RH_%"]
-    )
-    meteo_data["psy"] = lhb.psychrometric_constant(meteo_data["AirPress_hPa"])
-    he = lhb.latent_heat(meteo_data["f1"], meteo_data["ew"], meteo_data["ea"])
-    hc = lhb.sensible_heat(
-        meteo_data["psy"],
-        meteo_data["f1"],
-        temp_data["0.45"],
-        meteo_data["AirTemp_degC"],
-    )
-    ha = lhb.absorved_lw(meteo_data["AirTemp_degC"], meteo_data["emi"])
-    hs = lhb.swrad_in(meteo_data["Rad_Wm2"], meteo_data["Albedo"])
-    hw = lhb.emmited_lw(temp_data["0.45"])
-    hnet = lhb.heat_balance(hs, ha, hw, he, hc)
+    hnet = pd.Series(hnet, name="hnet", index=meteo_data.index, dtype=float)
 
     heatc_data = heat_content(temp_data, depth_data, bath_data)
-    dhdt = heatc_data.diff() / heatc_data.index.to_series().diff().dt.total_seconds()
+    # Time step in s from the index itself, whatever its datetime64 unit
+    dt = np.diff(heatc_data.index.to_numpy()) / np.timedelta64(1, "s")
+    dhdt = np.empty(len(heatc_data))
+    dhdt[0] = np.nan
+    dhdt[1:] = np.diff(heatc_data.to_numpy()) / dt
+    dhdt = pd.Series(dhdt, index=heatc_data.index)
     dhw = -(dhdt - hnet) * bath_data.Area_m2.max()
 
     wtemp = pd.Series(
@@ -75,68 +89,141 @@ def main():
     # -> Q m3/s
     flow = pd.Series(dhw.values / wheat.values, name="flow", index=dhw.index)
 
-    dhdt = dhdt.resample("d").mean()
-    hnet = hnet.resample("d").mean()  # *bath_data.iloc[0].Area_m2
-    dhw = dhw.resample("d").mean()
+    # Daily means, binning the time index once for all series
+    daily = pd.DataFrame(
+        {"dhdt": dhdt, "hnet": hnet, "dhw": dhw, "flow": flow}
+    ).resample("d").mean()
     # heatc_data = heatc_data.resample("d").mean()
-    flow = flow.resample("d").mean()*60*60
+    daily["flow"] = daily.flow*60*60  # m3/h
+
+    if output is not None:
+        daily.to_parquet(output)
+    if plot:
+        plot_results(daily, show=show)
+
+
+def plot_results(daily, show=True):
+
+    # Imported here so runs without --plot do not load matplotlib
+    import matplotlib
+
+    if not show:
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    plt.style.use("~/.config/matplotlib/aslo-paper.mplstyle")
 
     fig, axs = plt.subplots(3, 1, figsize=(5, 6), sharex=True)
-    dhdt.plot(
+    daily.dhdt.plot(
         ax=axs[0],
         label=r"$\frac{1}{A_\text{surf}}\frac{\partial \text{HC}}{\partial t}$",
     )
-    hnet.plot(ax=axs[0], color="r", label="Heat balance")
+    daily.hnet.plot(ax=axs[0], color="r", label="Heat balance")
     axs[0].legend()
     axs[0].set_ylabel(r"H$_\text{net}$ (\si{\watt\per\square\meter})")
-    dhw.plot(ax=axs[1])
+    daily.dhw.plot(ax=axs[1])
     axs[1].axhline(0)
     axs[1].set_ylabel(r"Missing heat (\si{\watt})")
-    flow.plot(ax=axs[2])
+    daily.flow.plot(ax=axs[2])
     axs[2].set_ylabel(r"Flow (\si{\cubic\meter\per\hour})")
     axs[2].axhline(0)
     fig.savefig('Flow_heatbudget.png', format='png')
-    plt.show()
+    if show:
+        plt.show()
 
 
 def heat_content(temp_data, depth_data, bath_data):
 
-    heatc_data = []
     temp_data["0"] = temp_data["0.45"]
     depth_data["0"] = 0
     depth_data.loc[temp_data["0.45"].isna(), "0"] = np.nan
-    for i, _ in enumerate(temp_data.index):
-        data_p = pd.DataFrame(
-            {"Depth_m": depth_data.iloc[i].values, "Temp_C": temp_data.iloc[i].values}
-        )
-        if data_p.Temp_C.isna().all():
-            heatc_data.append(np.nan)
-        else:
-            hct = pylake.heat_content(
-                data_p.Temp_C.values,
-                bath_data.Area_m2.values,
-                bath_data.Depth_m.values,
-                data_p.Depth_m.values,
-            )
-            heatc_data.append(hct.values[0])
 
+    # Sort every profile by depth (NaN depths go last)
+    depth = depth_data.to_numpy(dtype=float)
+    order = np.argsort(depth, axis=1)
+    depth = np.take_along_axis(depth, order, axis=1)
+    temp = np.take_along_axis(temp_data.to_numpy(dtype=float), order, axis=1)
+    rho = pylake.dens0(temp)
+
+    heatc_data = heat_content_batch(
+        temp,
+        rho,
+        depth,
+        bath_data.Area_m2.to_numpy(dtype=float),
+        bath_data.Depth_m.to_numpy(dtype=float),
+    )
     heatc_data = pd.Series(heatc_data, name="HC_Jm2", index=temp_data.index)
     return heatc_data
 
 
+@njit(parallel=True, cache=True)
+def heat_content_batch(temp, rho, depth, bth_a, bth_d):
+    # Same integral as pylake.heat_content, one profile (row) per timestep.
+    # Profiles must be sorted by depth, with NaN depths last.
+    dz = 0.1
+    cw = 4186
+    ntime, nsens = temp.shape
+    heatc = np.empty(ntime)
+    for i in prange(ntime):
+        heatc[i] = np.nan
+        if np.isnan(temp[i]).all():
+            continue
+        ztop = np.nanmin(depth[i])
+        nlayer = int(np.ceil((np.nanmax(depth[i]) - ztop) / dz))
+        j = 0
+        u = 0.0
+        for k in range(nlayer):
+            z = ztop + dz * k
+            while j < nsens - 2 and depth[i, j + 1] <= z:
+                j += 1
+            w = (z - depth[i, j]) / (depth[i, j + 1] - depth[i, j])
+            layer_t = temp[i, j] + w * (temp[i, j + 1] - temp[i, j])
+            layer_rho = rho[i, j] + w * (rho[i, j + 1] - rho[i, j])
+            layer_u = layer_t * layer_rho * np.interp(z, bth_d, bth_a) * dz * cw
+            if not np.isnan(layer_u):
+                u += layer_u
+        heatc[i] = u / np.interp(ztop, bth_d, bth_a)
+    return heatc
+
+
 def interp_temp(data_p, date, newz):
 
     # newz = pd.Series(np.arange(0, data_p.Depth_m.max()+1, 1), name='Depth_m')
-    newdata_p = pd.merge(data_p, newz, on="Depth_m", how="outer")
-    newdata_p = newdata_p.set_index("Depth_m")
-    newdata_p = newdata_p.interpolate(
-        method="slinear", limit_direction="both", limit=2
-    ).bfill()
-    newdata_p.reset_index(inplace=True)
+    data_p = data_p.sort_values("Depth_m")
+    depth = data_p.Depth_m.to_numpy(dtype=float)
+    newdepth = np.union1d(depth, newz.to_numpy(dtype=float))
+    newdata_p = pd.DataFrame({"Depth_m": newdepth})
+    for col in data_p.columns.drop("Depth_m"):
+        values = data_p[col].to_numpy(dtype=float)
+        valid = ~np.isnan(values)
+        if not valid.any():
+            newdata_p[col] = np.nan
+            continue
+        # Constant above the shallowest sensor, NaN below the deepest one
+        newdata_p[col] = np.interp(newdepth, depth[valid], values[valid], right=np.nan)
     newdata_p["Datetime"] = date
     newdata_p.set_index("Datetime", inplace=True)
     return newdata_p
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Lake surface heat budget")
+    parser.add_argument(
+        "--plot",
+        action="store_true",
+        help="plot the daily heat budget and save it to Flow_heatbudget.png",
+    )
+    parser.add_argument(
+        "--no-show",
+        dest="show",
+        action="store_false",
+        help="only save the figure (no display needed), implies --plot",
+    )
+    parser.add_argument(
+        "--output", help="write the daily heat budget to this Parquet file"
+    )
+    args = parser.parse_args()
+    plot = args.plot or not args.show
+    if not plot and args.output is None:
+        parser.exit(message="Nothing to do: use --plot and/or --output FILE\n")
+    main(plot=plot, show=args.show, output=args.output)